@@ -1,14 +1,21 @@
 from fastapi import FastAPI, Query, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import date
 from pydantic import BaseModel
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+import io
 import os
+import traceback
 
 from jugaad_data.nse import stock_df, index_df
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
-import json
+import orjson
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -26,10 +33,13 @@ app = FastAPI(
     version="1.1.0"
 )
 
+# Stock/index histories repeat the same keys on every row and compress well
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # --- Pydantic Models ---
 
 class StockData(BaseModel):
-    DATE: str
+    DATE: Optional[str] = None
     SYMBOL: str
     OPEN: float
     HIGH: float
@@ -38,7 +48,7 @@ class StockData(BaseModel):
     VOLUME: int
 
 class IndexData(BaseModel):
-    DATE: str
+    DATE: Optional[str] = None
     SYMBOL: str
     OPEN: float
     HIGH: float
@@ -53,62 +63,102 @@ stock_cache = None
 try:
     mongo_url = os.environ.get("MONGO_URL")
     if mongo_url:
-        mongo_client = MongoClient(mongo_url)
+        mongo_client = MongoClient(mongo_url, maxPoolSize=50, minPoolSize=5)
         mongo_client.admin.command('ping')  # Check connection
         db = mongo_client["jugaad_cache"]
         stock_cache = db["stock_data"]
 except Exception as e:
     print("⚠️ MongoDB not available. Skipping DB caching.")
 
-# --- Helper: F&O Symbols ---
+if stock_cache is not None:
+    try:
+        stock_cache.create_index([("symbol", 1), ("from_date", 1), ("to_date", 1)], unique=True)
+    except Exception as e:
+        print("Mongo index error:", e)
 
-def get_fno_symbols() -> List[str]:
-    """
-    Reads F&O symbols from CSV packaged with jugaad_data.
-    """
-    fno_csv = os.path.join(os.path.dirname(__import__('jugaad_data').__file__), "resources", "nse_fo_mkt_symbols.csv")
-    df = pd.read_csv(fno_csv)
-    return df["SYMBOL"].unique().tolist()
+# --- F&O Symbols ---
 
-# --- API Routes ---
+# Loaded once at startup from the CSV packaged with jugaad_data
+_FNO_CSV = os.path.join(os.path.dirname(__import__('jugaad_data').__file__), "resources", "nse_fo_mkt_symbols.csv")
 
-@app.get("/", tags=["Root"])
-def root():
-    return {
-        "message": "📈 Welcome to the Jugaad Data API!",
-        "docs": "/docs",
-        "example": "/stock-data/?symbol=INFY&from_date=2022-01-01&to_date=2022-01-15"
-    }
+FNO_SYMBOLS: frozenset = frozenset()
+try:
+    FNO_SYMBOLS = frozenset(pd.read_csv(_FNO_CSV, usecols=["SYMBOL"], dtype={"SYMBOL": "string"})["SYMBOL"].unique())
+except Exception as e:
+    print("⚠️ F&O symbols list not available:", e)
 
-@app.get("/stock-data/", response_model=List[StockData], tags=["Stock Data"])
-def get_stock_data(
-    symbol: str = Query(..., description="Stock symbol, e.g., INFY, TCS, RELIANCE, ICICIBANK"),
-    from_date: date = Query(..., description="Start date in YYYY-MM-DD format"),
-    to_date: date = Query(..., description="End date in YYYY-MM-DD format"),
-    fno_only: bool = Query(False, description="Set true to restrict to F&O stocks only")
-):
-    import traceback
-    symbol = symbol.upper()
+FNO_SYMBOL_LIST: List[str] = sorted(FNO_SYMBOLS)
 
-    # Validate date range
-    if from_date > to_date:
-        raise HTTPException(status_code=400, detail=f"`from_date` ({from_date}) cannot be after `to_date` ({to_date})")
+# --- Helper: Record Serialization ---
 
-    if fno_only:
-        fno_symbols = get_fno_symbols()
-        if symbol not in fno_symbols:
-            raise HTTPException(status_code=400, detail=f"{symbol} is not in the F&O stock list.")
+def format_dates(col: pd.Series):
+    """
+    Formats a date column as YYYY-MM-DD strings.
+    Uses NumPy's ISO day formatting instead of calling strftime per element,
+    and only parses the column when it is not already datetime-typed.
+    Unparseable dates (NaT) become None rather than the string "NaT".
+    """
+    if not pd.api.types.is_datetime64_any_dtype(col):
+        col = pd.to_datetime(col)
+    values = col.values
+    return np.where(pd.isna(values), None, values.astype("datetime64[D]").astype(str))
+
+def format_volumes(col: pd.Series):
+    """
+    Converts a volume column that may hold NaN to Python ints,
+    with None for missing values, to match the documented Optional[int].
+    """
+    values = col.to_numpy(dtype="float64")
+    missing = np.isnan(values)
+    return np.where(missing, None, np.where(missing, 0, values).astype("int64"))
+
+RECORD_COLUMNS = ["DATE", "SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]
+
+def df_to_records(df: pd.DataFrame, columns: List[str] = RECORD_COLUMNS) -> List[dict]:
+    """
+    Faster equivalent of df[columns].to_dict(orient="records").
+    Pulls each column straight out of the frame as a native Python list,
+    without building a df[columns] sub-frame first.
+    """
+    lists = [df[col].tolist() for col in columns]
+    return [dict(zip(columns, row)) for row in zip(*lists)]
+
+# --- Helper: Stock Data ---
+
+# Possible column layouts returned by stock_df
+_CH_COL_MAP = {
+    "CH_TIMESTAMP": "DATE",
+    "CH_OPENING_PRICE": "OPEN",
+    "CH_TRADE_HIGH_PRICE": "HIGH",
+    "CH_TRADE_LOW_PRICE": "LOW",
+    "CH_CLOSING_PRICE": "CLOSE",
+    "CH_TOT_TRADED_QTY": "VOLUME"
+}
+_CH_KEYS = list(_CH_COL_MAP)
+_CH_KEYSET = frozenset(_CH_KEYS)
+
+_SIMPLE_KEYS = ["DATE", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]
+_SIMPLE_KEYSET = frozenset(_SIMPLE_KEYS)
+
+def _fetch_stock_payload(symbol: str, from_date: date, to_date: date, use_cache: bool = True) -> bytes:
+    """
+    Returns the encoded JSON payload for a stock's history.
+    Looks up the MongoDB cache first (when use_cache is set), then falls back to NSE.
+    """
+    cache_key = {
+        "symbol": symbol,
+        "from_date": str(from_date),
+        "to_date": str(to_date)
+    }
 
     # Try DB cache if available
-    if stock_cache:
-        cached = stock_cache.find_one({
-            "symbol": symbol,
-            "from_date": str(from_date),
-            "to_date": str(to_date)
-        })
+    if use_cache and stock_cache is not None:
+        cached = stock_cache.find_one(cache_key, projection={"parquet": 1, "_id": 0})
+        # Rows are stored as Parquet bytes; entries in an older format have no
+        # "parquet" field and are overwritten by the fresh fetch below
         if cached:
             try:
-                return json.loads(cached["data"])
+                return orjson.dumps(df_to_records(pd.read_parquet(io.BytesIO(cached["parquet"]))))
             except Exception as e:
                 print("Cache decoding error:", e)
 
@@ -120,32 +170,14 @@ def get_stock_data(
             raise HTTPException(status_code=404, detail=f"No data found for {symbol} between {from_date} and {to_date}")
 
         # Normalize column names
-        df.columns = [col.upper() for col in df.columns]
-
-        # Define possible column mappings
-        ch_col_map = {
-            "CH_TIMESTAMP": "DATE",
-            "CH_OPENING_PRICE": "OPEN",
-            "CH_TRADE_HIGH_PRICE": "HIGH",
-            "CH_TRADE_LOW_PRICE": "LOW",
-            "CH_CLOSING_PRICE": "CLOSE",
-            "CH_TOT_TRADED_QTY": "VOLUME"
-        }
-
-        simple_col_map = {
-            "DATE": "DATE",
-            "OPEN": "OPEN",
-            "HIGH": "HIGH",
-            "LOW": "LOW",
-            "CLOSE": "CLOSE",
-            "VOLUME": "VOLUME"
-        }
+        df.columns = df.columns.str.upper()
 
         # Choose appropriate mapping
-        if all(col in df.columns for col in ch_col_map.keys()):
-            df = df[list(ch_col_map.keys())].rename(columns=ch_col_map)
-        elif all(col in df.columns for col in simple_col_map.keys()):
-            df = df[list(simple_col_map.keys())]
+        cols = frozenset(df.columns)
+        if _CH_KEYSET <= cols:
+            df = df[_CH_KEYS].rename(columns=_CH_COL_MAP)
+        elif _SIMPLE_KEYSET <= cols:
+            df = df[_SIMPLE_KEYS]
         else:
             print(f"Returned columns from NSE for {symbol}:", df.columns.tolist())
             raise HTTPException(
@@ -154,24 +186,22 @@ def get_stock_data(
             )
 
         # Format and add SYMBOL
-        df["DATE"] = pd.to_datetime(df["DATE"]).dt.strftime("%Y-%m-%d")
+        df["DATE"] = format_dates(df["DATE"])
         df["SYMBOL"] = symbol
 
-        result = df[["DATE", "SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]].to_dict(orient="records")
+        result = df_to_records(df)
+        payload = orjson.dumps(result)
 
         # Save to DB cache
-        if stock_cache:
+        if use_cache and stock_cache is not None:
             try:
-                stock_cache.insert_one({
-                    "symbol": symbol,
-                    "from_date": str(from_date),
-                    "to_date": str(to_date),
-                    "data": json.dumps(result)
-                })
+                buf = io.BytesIO()
+                df[RECORD_COLUMNS].to_parquet(buf, engine="pyarrow", compression="zstd", index=False)
+                stock_cache.replace_one(cache_key, {**cache_key, "parquet": buf.getvalue()}, upsert=True)
             except Exception as e:
                 print("Mongo insert error:", e)
 
-        return result
+        return payload
 
     except ValueError as ve:
         print("Parsing error:", ve)
@@ -180,16 +210,24 @@ def get_stock_data(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error fetching stock data: {str(e)}")
 
+# Each entry is a full encoded history, so keep the per-worker cache small
+_cached_stock_payload = lru_cache(maxsize=32)(_fetch_stock_payload)
 
+def get_stock_payload(symbol: str, from_date: date, to_date: date) -> bytes:
+    """
+    Caches payloads (in MongoDB and per process) only for ranges that end
+    before today, since history for those dates no longer changes.
+    """
+    if to_date < date.today():
+        return _cached_stock_payload(symbol, from_date, to_date)
+    return _fetch_stock_payload(symbol, from_date, to_date, use_cache=False)
 
-@app.get("/index-data/", response_model=List[IndexData], tags=["Index Data"])
-def get_index_data(
-    symbol: str = Query(..., description="Index symbol, e.g., NIFTY, BANKNIFTY"),
-    from_date: date = Query(...),
-    to_date: date = Query(...)
-):
-    symbol = symbol.upper()
+# --- Helper: Index Data ---
 
+def get_index_payload(symbol: str, from_date: date, to_date: date) -> bytes:
+    """
+    Fetches an index's history from NSE and returns it as encoded JSON.
+    """
     try:
         df = index_df(symbol=symbol, from_date=from_date, to_date=to_date)
     except Exception as e:
@@ -198,33 +236,81 @@ def get_index_data(
     if df.empty:
         raise HTTPException(status_code=404, detail=f"No index data found for {symbol} between {from_date} and {to_date}")
 
-    df["DATE"] = df["DATE"].dt.strftime("%Y-%m-%d")
+    df["DATE"] = format_dates(df["DATE"])
+    df["VOLUME"] = format_volumes(df["VOLUME"])
     df["SYMBOL"] = symbol
-    return df[["DATE", "SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]].to_dict(orient="records")
+    return orjson.dumps(df_to_records(df))
+
+# --- API Routes ---
+
+@app.get("/", tags=["Root"])
+def root():
+    return {
+        "message": "📈 Welcome to the Jugaad Data API!",
+        "docs": "/docs",
+        "example": "/stock-data/?symbol=INFY&from_date=2022-01-01&to_date=2022-01-15"
+    }
+
+@app.get("/stock-data/", responses={200: {"model": List[StockData]}}, tags=["Stock Data"])
+async def get_stock_data(
+    symbol: str = Query(..., description="Stock symbol, e.g., INFY, TCS, RELIANCE, ICICIBANK"),
+    from_date: date = Query(..., description="Start date in YYYY-MM-DD format"),
+    to_date: date = Query(..., description="End date in YYYY-MM-DD format"),
+    fno_only: bool = Query(False, description="Set true to restrict to F&O stocks only")
+):
+    symbol = symbol.upper()
+
+    # Validate date range
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail=f"`from_date` ({from_date}) cannot be after `to_date` ({to_date})")
+
+    if fno_only:
+        if not FNO_SYMBOLS:
+            raise HTTPException(status_code=503, detail="F&O symbol list is not available.")
+        if symbol not in FNO_SYMBOLS:
+            raise HTTPException(status_code=400, detail=f"{symbol} is not in the F&O stock list.")
+
+    payload = await run_in_threadpool(get_stock_payload, symbol, from_date, to_date)
+    return Response(content=payload, media_type="application/json")
+
+
+@app.get("/index-data/", responses={200: {"model": List[IndexData]}}, tags=["Index Data"])
+async def get_index_data(
+    symbol: str = Query(..., description="Index symbol, e.g., NIFTY, BANKNIFTY"),
+    from_date: date = Query(...),
+    to_date: date = Query(...)
+):
+    symbol = symbol.upper()
+    payload = await run_in_threadpool(get_index_payload, symbol, from_date, to_date)
+    return Response(content=payload, media_type="application/json")
 
 @app.get("/fno-symbols/", response_model=List[str], tags=["Metadata"])
 def list_fno_symbols():
     """
     Returns the list of all F&O tradable stock symbols.
     """
-    return get_fno_symbols()
+    if not FNO_SYMBOLS:
+        raise HTTPException(status_code=503, detail="F&O symbol list is not available.")
+    return FNO_SYMBOL_LIST
 
 
 @app.get("/test-mongodb/", tags=["Debug"])
 def test_mongodb():
+    global mongo_client
     try:
-        mongo_url = os.environ.get("MONGO_URL")
-        print(f"🔍 MONGO_URL: {mongo_url}")  # DEBUG
+        if mongo_client is None:
+            mongo_url = os.environ.get("MONGO_URL")
+            print(f"🔍 MONGO_URL: {mongo_url}")  # DEBUG
 
-        if mongo_url:
-            mongo_client = MongoClient(mongo_url, serverSelectionTimeoutMS=5000)
-            mongo_client.admin.command('ping')  # Check connection
-            print("✅ MongoDB ping successful")
+            if not mongo_url:
+                print("⚠️ MONGO_URL not found in environment.")
+                return
+            mongo_client = MongoClient(mongo_url, serverSelectionTimeoutMS=5000, maxPoolSize=50, minPoolSize=5)
 
-            db = mongo_client["jugaad_cache"]
-            stock_cache = db["stock_data"]
-            print("✅ MongoDB collection ready:", stock_cache.full_name)
-        else:
-            print("⚠️ MONGO_URL not found in environment.")
+        mongo_client.admin.command('ping')  # Check connection
+        print("✅ MongoDB ping successful")
+
+        db = mongo_client["jugaad_cache"]
+        print("✅ MongoDB collection ready:", db["stock_data"].full_name)
     except Exception as e:
         print("❌ MongoDB initialization failed:", e)
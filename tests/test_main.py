@@ -0,0 +1,79 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+import orjson
+import main
+from main import RECORD_COLUMNS, df_to_records, format_dates, format_volumes
+
+def sample_df(rows):
+    return pd.DataFrame({
+        "DATE": ["2020-01-%02d" % (i + 1) for i in range(rows)],
+        "SERIES": ["EQ"] * rows,
+        "OPEN": [100.5 + i for i in range(rows)],
+        "HIGH": [110.25 + i for i in range(rows)],
+        "LOW": [90.0 + i for i in range(rows)],
+        "CLOSE": [105.75 + i for i in range(rows)],
+        "VOLUME": [1000 * (i + 1) for i in range(rows)],
+        "SYMBOL": ["SBIN"] * rows,
+    })
+
+def test_df_to_records():
+    for rows in [0, 1, 5]:
+        df = sample_df(rows)
+        records = df_to_records(df)
+        assert records == df[RECORD_COLUMNS].to_dict("records")
+        for rec in records:
+            assert list(rec) == RECORD_COLUMNS
+            assert type(rec["DATE"]) is str
+            assert type(rec["OPEN"]) is float
+            assert type(rec["VOLUME"]) is int
+
+def test_df_to_records_json():
+    for rows in [1, 2, 5]:
+        df = sample_df(rows)
+        records = df_to_records(df)
+        assert orjson.loads(orjson.dumps(records)) == records
+
+    # Missing index volumes are floats (NaN) and must serialize as null
+    df = sample_df(2)
+    df["VOLUME"] = format_volumes(pd.Series([np.nan, 2000.0]))
+    decoded = orjson.loads(orjson.dumps(df_to_records(df)))
+    assert decoded[0]["VOLUME"] is None
+    assert type(decoded[1]["VOLUME"]) is int
+    assert decoded[1]["VOLUME"] == 2000
+
+def test_format_dates():
+    expected = ["2020-01-01", "2020-07-30"]
+
+    col = pd.Series(np.array(["2020-01-01", "2020-07-30"], dtype="datetime64[ns]"))
+    assert format_dates(col).tolist() == expected
+
+    col = pd.Series(["2020-01-01", "2020-07-30"])
+    assert format_dates(col).tolist() == expected
+
+    col = pd.Series(np.array(["2020-01-01", "NaT"], dtype="datetime64[ns]"))
+    assert format_dates(col).tolist() == ["2020-01-01", None]
+
+    col = pd.Series(["2020-01-01", None])
+    assert format_dates(col).tolist() == ["2020-01-01", None]
+
+class StubCollection:
+    def __init__(self):
+        self.calls = []
+
+    def find_one(self, *args, **kwargs):
+        self.calls.append("find_one")
+        return {"parquet": b""}
+
+    def replace_one(self, *args, **kwargs):
+        self.calls.append("replace_one")
+
+def test_open_range_skips_cache(monkeypatch):
+    df = sample_df(2)[["DATE", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]]
+    stub = StubCollection()
+    monkeypatch.setattr(main, "stock_cache", stub)
+    monkeypatch.setattr(main, "stock_df", lambda **kwargs: df.copy())
+
+    payload = main.get_stock_payload("SBIN", date(2020, 1, 1), date.today())
+    assert stub.calls == []
+    assert [rec["DATE"] for rec in orjson.loads(payload)] == ["2020-01-01", "2020-01-02"]